@@ -11,5 +11,6 @@ Y <- proteinScore(HPOPatient)
 ClinPriorGeneScore <- MatrixPropagation(Y, alpha = 0.2)
 
 colnames(ClinPriorGeneScore) <- make.names(colnames(ClinPriorGeneScore), unique = TRUE)
-output_file <- paste0("/mnt/", args[2], "_clinprior.csv")
+out_dir <- if (length(args) >= 3) args[3] else "/mnt"
+output_file <- paste0(out_dir, "/", args[2], "_clinprior.csv")
 write.csv(ClinPriorGeneScore, output_file, row.names = FALSE)
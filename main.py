@@ -1,11 +1,18 @@
 from pathlib import Path
 import asyncio
+import functools
+import hashlib
+import os
 import shutil
-from typing import Optional, List, Callable
+import threading
+import uuid
+from typing import Optional, List, Callable, Dict, Set
+import multiprocessing
+from multiprocessing.pool import Pool
 from concurrent.futures import ThreadPoolExecutor
 
 from joblib import cpu_count
-import nltk
+from openai import OpenAI
 import typer
 from rich.console import Console
 from rich.progress import (
@@ -26,10 +33,26 @@ from modules.utils import (
     log,
     check_file_exists,
     setup_logging_file_only,
+    configure_rate_limiter,
+    set_rate_limiter,
+    LimiterManager,
+)
+from modules.text_ops import process_text, SentenceStream, ensure_punkt
+from modules.hpo_ops import (
+    get_hpo,
+    filter_terms,
+    execute_clinprior,
+    TaggingWorker,
+    PersistentContainer,
+    load_whitelist,
+    remove_run_containers,
+    PHENOTAGGER_IMAGE,
+    CLINPRIOR_IMAGE,
 )
-from modules.text_ops import process_text
-from modules.hpo_ops import get_hpo, filter_terms, execute_clinprior
 from modules.db_ops import modify_sqlite
+from modules.store_ops import ResultsStore, STORE_NAME
+from modules.resources import warm_up
+from modules.serve_ops import Job, JobQueue, make_server
 
 app = typer.Typer(add_help_option=False)
 BASE_DIR = Path(__file__).parent
@@ -44,18 +67,30 @@ class Pipeline:
         output_dir: Path,
         show_progress: bool = True,
         tail_cb: Optional[Callable[[str], None]] = None,
+        overlap: bool = False,
+        prefilter: bool = True,
+        client: Optional[OpenAI] = None,
+        tagger_container: Optional[PersistentContainer] = None,
+        clinprior_container: Optional[PersistentContainer] = None,
     ):
         self.med_doc = med_doc
         self.sqlite_path = sqlite_path
         self.sample_name = sqlite_path.stem.split(".", 1)[0]
         self.result_dir = output_dir
         self.show_progress = show_progress
-        self.chat = DeepSeekClient(api_key=api_key)
+        self.overlap = overlap
+        self.prefilter = prefilter
+        self.tagger_container = tagger_container
+        self.clinprior_container = clinprior_container
+        self.chat = DeepSeekClient(api_key=api_key, client=client)
         if tail_cb:
             self.chat.tail_cb = tail_cb
 
     def run(self):
-        nltk.download("punkt", quiet=True)
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        ensure_punkt()
         ctx = (
             Progress(
                 SpinnerColumn(),
@@ -88,30 +123,52 @@ class Pipeline:
 
         text = self.med_doc.read_text(encoding="utf-8")
 
+        tagger = (
+            TaggingWorker(self.sample_name, self.result_dir, container=self.tagger_container)
+            if self.overlap
+            else None
+        )
+        stream = SentenceStream(tagger.submit, tagger.reset) if tagger else None
+
         step("Step 2/6: Processing text")
-        processed = process_text(text, self.chat, self.sample_name, self.result_dir)
+        try:
+            processed = await asyncio.to_thread(
+                process_text, text, self.chat, self.sample_name, self.result_dir, stream
+            )
 
-        step("Step 3/6: Extracting HPO")
-        hpo_terms = get_hpo(processed, self.chat, self.sample_name, self.result_dir)
+            step("Step 3/6: Extracting HPO")
+            hpo_terms = await get_hpo(
+                processed, self.chat, self.sample_name, self.result_dir, tagger, self.tagger_container
+            )
+        except BaseException:
+            if tagger:
+                await tagger.abort()
+            raise
 
         step("Step 4/6: Filtering terms")
-        filtered = filter_terms(
-            hpo_terms, processed, self.chat, self.sample_name, self.result_dir
+        filtered = await asyncio.to_thread(
+            filter_terms,
+            hpo_terms,
+            processed,
+            self.chat,
+            self.sample_name,
+            self.result_dir,
+            self.prefilter,
         )
 
         step("Step 5/6: Running ClinPrior")
-        self._execute_clinprior(filtered)
+        await self._execute_clinprior(filtered)
 
         step("Step 6/6: Modifying SQLite")
-        modify_sqlite(self.sqlite_path, self.sample_name, self.result_dir)
+        await asyncio.to_thread(modify_sqlite, self.sqlite_path, self.sample_name, self.result_dir)
 
         if ctx:
             ctx.update(steps, advance=1, description="Done")
             ctx.__exit__(None, None, None)
         log.info("Pipeline completed.")
 
-    def _execute_clinprior(self, filtered_terms: Optional[str]):
-        wl = self._load_whitelist()
+    async def _execute_clinprior(self, filtered_terms: Optional[str]):
+        wl = load_whitelist()
         final_terms = (
             ",".join(t for t in filtered_terms.split(",") if t in wl)
             if filtered_terms
@@ -121,16 +178,53 @@ class Pipeline:
         dst = self.result_dir / "clinprior_script.r"
         if not dst.exists():
             shutil.copy(src, dst)
-        execute_clinprior(final_terms, self.sample_name, self.result_dir)
-
-    def _load_whitelist(self):
-        wl_path = Path("data") / "hpo_whitelist.txt"
-        check_file_exists(wl_path)
-        return {l.strip() for l in wl_path.read_text(encoding="utf-8").splitlines() if l.strip()}
+        await execute_clinprior(
+            final_terms, self.sample_name, self.result_dir, self.clinprior_container
+        )
 
 
 def _collect_docs(folder: Path) -> List[Path]:
-    return list(folder.rglob("*.txt"))
+    return [p for p in folder.rglob("*.txt") if p.is_file()]
+
+
+def _doc_hash(doc: Path) -> str:
+    text = doc.read_text(encoding="utf-8", errors="replace")
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def _doc_key(docs_dir: Path, doc: Path) -> str:
+    # Keeps the .txt suffix: a file path is never a parent directory of another
+    # file, so no output dir can end up nested inside another one.
+    return doc.relative_to(docs_dir).as_posix()
+
+
+def _doc_out_dir(output_root: Path, sample_name: str, docs_dir: Path, doc: Path) -> Path:
+    return output_root / f"result_{sample_name}" / _doc_key(docs_dir, doc)
+
+
+def _group_duplicates(docs: List[Path], dedup: bool = True) -> Dict[str, List[Path]]:
+    groups: Dict[str, List[Path]] = {}
+    for doc in sorted(docs):
+        key = _doc_hash(doc) if dedup else str(doc)
+        groups.setdefault(key, []).append(doc)
+    return groups
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _fan_out(src_dir: Path, dst_dirs: List[Path]):
+    for dst in dst_dirs:
+        if dst == src_dir:
+            continue
+        if dst.exists():
+            shutil.rmtree(dst)
+        shutil.copytree(src_dir, dst, copy_function=_link_or_copy)
+        log.info(f"Duplicate result linked: {src_dir} -> {dst}")
 
 
 def _is_output_complete(out_dir: Path, sample_name: str) -> bool:
@@ -142,69 +236,217 @@ def _is_output_complete(out_dir: Path, sample_name: str) -> bool:
     return all(p.exists() for p in expected)
 
 
-def _run_pipeline_sync(
+async def _run_doc_async(
     med_doc: Path,
     sqlite_path: Path,
-    output_root: Path,
+    out_dir: Path,
     api_key: Optional[str],
-    bar_progress: Progress,
-    bar_id: int,
-    tail_progress: Progress,
-    tail_id: int,
-):
-    sample_name = sqlite_path.stem.split(".", 1)[0]
-    out_dir = output_root / f"result_{sample_name}" / med_doc.stem
+    overlap: bool = False,
+    dup_dirs: Optional[List[Path]] = None,
+    tail_cb: Optional[Callable[[str], None]] = None,
+    prefilter: bool = True,
+) -> bool:
     try:
         if out_dir.exists():
             shutil.rmtree(out_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
-
-        def _tail_update(msg: str):
-            tail_progress.update(tail_id, description=msg[:100])
-
-        Pipeline(
+        await Pipeline(
             med_doc,
             sqlite_path,
             api_key,
             out_dir,
             show_progress=False,
-            tail_cb=_tail_update,
-        ).run()
-        bar_progress.update(bar_id, advance=1)
+            tail_cb=tail_cb,
+            overlap=overlap,
+            prefilter=prefilter,
+        ).run_async()
+        _fan_out(out_dir, dup_dirs or [])
         return True
-    except Exception as e:
-        (out_dir / "error.txt").write_text(str(e))
-        log.error(f"FAILED {med_doc}: {e}")
-        bar_progress.update(bar_id, advance=1)
+    except (Exception, SystemExit) as e:
+        msg = f"Pipeline exited with code {e.code}" if isinstance(e, SystemExit) else str(e)
+        _record_failure(med_doc, msg, [out_dir, *(dup_dirs or [])])
         return False
 
 
+def _record_failure(med_doc: Path, msg: str, dirs: List[Path]):
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+        (d / "error.txt").write_text(msg)
+    log.error(f"FAILED {med_doc}: {msg}")
+
+
+def _run_doc(
+    med_doc: Path,
+    sqlite_path: Path,
+    out_dir: Path,
+    api_key: Optional[str],
+    overlap: bool = False,
+    dup_dirs: Optional[List[Path]] = None,
+    tail_cb: Optional[Callable[[str], None]] = None,
+    prefilter: bool = True,
+) -> bool:
+    return asyncio.run(
+        _run_doc_async(
+            med_doc, sqlite_path, out_dir, api_key, overlap, dup_dirs, tail_cb, prefilter
+        )
+    )
+
+
+def _store_result(
+    store: ResultsStore,
+    doc_keys: List[str],
+    sample_name: str,
+    run_dir: Path,
+    content_hash: Optional[str],
+    keep_files: bool,
+    ok: bool,
+) -> bool:
+    try:
+        store.ingest(doc_keys, sample_name, run_dir, ok, content_hash)
+    except Exception as e:
+        log.error(f"Storing results of {', '.join(doc_keys)} failed: {e}")
+        store.mark_failed(doc_keys, sample_name, f"Storing results failed: {e}", content_hash)
+        ok = False
+    if not keep_files:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return ok
+
+
+def _discard_tail(msg: str):
+    pass
+
+
+_started_tasks = None
+_pool_watchers: Set[asyncio.Task] = set()
+
+
+def _init_process_worker(log_file: Path, log_level: str, limiter, started):
+    global _started_tasks
+    setup_logging_file_only(log_file, log_level)
+    set_rate_limiter(limiter)
+    _started_tasks = started
+
+
+def _run_pool_task(task_id: str, fn: Callable, *args):
+    # Recorded synchronously in the manager before any work, so the parent can
+    # tell which worker holds the task if that worker dies.
+    _started_tasks[task_id] = os.getpid()
+    try:
+        return fn(*args)
+    finally:
+        _started_tasks.pop(task_id, None)
+
+
+def _make_process_pool(workers: int, max_tasks_per_child: int, initargs: tuple) -> Pool:
+    # Resources are loaded here, before the fork, so every worker (including
+    # the ones recycled after max_tasks_per_child) shares them copy-on-write.
+    warm_up()
+    return multiprocessing.get_context("fork").Pool(
+        processes=workers,
+        initializer=_init_process_worker,
+        initargs=initargs,
+        maxtasksperchild=max_tasks_per_child,
+    )
+
+
+def _submit_to_pool(loop, pool: Pool, started, fn: Callable, *args) -> asyncio.Future:
+    fut = loop.create_future()
+    task_id = uuid.uuid4().hex
+
+    def _resolve(setter, value):
+        if not fut.done():
+            setter(value)
+
+    pool.apply_async(
+        _run_pool_task,
+        (task_id, fn, *args),
+        callback=lambda r: loop.call_soon_threadsafe(_resolve, fut.set_result, r),
+        error_callback=lambda e: loop.call_soon_threadsafe(_resolve, fut.set_exception, e),
+    )
+    watcher = loop.create_task(_watch_pool_task(pool, started, task_id, fut))
+    _pool_watchers.add(watcher)
+    watcher.add_done_callback(_pool_watchers.discard)
+    return fut
+
+
+async def _watch_pool_task(pool: Pool, started, task_id: str, fut: asyncio.Future, interval: float = 5.0):
+    # Pool never calls back for a task whose worker was killed (OOM, segfault),
+    # so a task whose worker is gone is failed here. It must be seen gone on two
+    # checks in a row: a recycled worker exits right after sending its result.
+    missing = 0
+    while not fut.done():
+        await asyncio.wait([fut], timeout=interval)
+        if fut.done():
+            break
+        pid = started.get(task_id)
+        alive = {p.pid for p in list(pool._pool) if p.exitcode is None}
+        missing = missing + 1 if pid is not None and pid not in alive else 0
+        if missing >= 2:
+            started.pop(task_id, None)
+            fut.set_exception(RuntimeError(f"Worker process {pid} died"))
+
+
 async def _process_doc_async(
     sem: asyncio.Semaphore,
     loop,
     executor,
     med_doc: Path,
     sqlite_path: Path,
-    output_root: Path,
+    out_dir: Path,
     api_key: Optional[str],
     bar_progress: Progress,
     bar_id: int,
     tail_progress: Progress,
     tail_id: int,
+    overlap: bool = False,
+    dup_dirs: Optional[List[Path]] = None,
+    on_done: Optional[Callable[[bool], bool]] = None,
+    prefilter: bool = True,
+    started=None,
 ):
     async with sem:
-        return await loop.run_in_executor(
-            executor,
-            _run_pipeline_sync,
-            med_doc,
-            sqlite_path,
-            output_root,
-            api_key,
-            bar_progress,
-            bar_id,
-            tail_progress,
-            tail_id,
-        )
+        if isinstance(executor, Pool):
+            try:
+                ok = await _submit_to_pool(
+                    loop,
+                    executor,
+                    started,
+                    _run_doc,
+                    med_doc,
+                    sqlite_path,
+                    out_dir,
+                    api_key,
+                    overlap,
+                    dup_dirs,
+                    _discard_tail,
+                    prefilter,
+                )
+            except Exception as e:
+                _record_failure(med_doc, str(e), [out_dir, *(dup_dirs or [])])
+                ok = False
+        else:
+
+            def _tail_update(msg: str):
+                tail_progress.update(tail_id, description=msg[:100])
+
+            ok = await _run_doc_async(
+                med_doc,
+                sqlite_path,
+                out_dir,
+                api_key,
+                overlap,
+                dup_dirs,
+                _tail_update,
+                prefilter,
+            )
+        if on_done:
+            try:
+                ok = on_done(ok)
+            except Exception as e:
+                log.error(f"Recording result of {med_doc} failed: {e}")
+                ok = False
+        bar_progress.update(bar_id, advance=1)
+        return ok
 
 
 async def _batch_async(
@@ -214,7 +456,20 @@ async def _batch_async(
     config: Optional[Path],
     log_level: str,
     workers: int,
+    overlap: bool = False,
+    dedup: bool = True,
+    rpm: int = 500,
+    tpm: int = 300_000,
+    llm_concurrency: Optional[int] = None,
+    executor_kind: str = "thread",
+    max_tasks_per_child: int = 20,
+    use_store: bool = False,
+    export_files: bool = True,
+    prefilter: bool = True,
 ):
+    if executor_kind not in ("thread", "process"):
+        log.error(f"Unknown executor: {executor_kind}")
+        raise typer.Exit(code=1)
     for p in (docs_dir, sqlite_path):
         check_file_exists(p)
 
@@ -228,31 +483,96 @@ async def _batch_async(
     output_root.mkdir(parents=True, exist_ok=True)
     setup_logging_file_only(output_root / "phen_prior.log", log_level)
     api_key = load_config(config)
+    if executor_kind == "thread":
+        configure_rate_limiter(rpm=rpm, tpm=tpm, max_concurrency=llm_concurrency or workers)
 
     sample_name = sqlite_path.stem.split(".", 1)[0]
+    store = ResultsStore(output_root / STORE_NAME) if use_store else None
+    # Notes already done in the store are never read again; their stored
+    # hashes still let new duplicates of them be linked instead of rerun.
+    done_hashes = store.completed(sample_name) if store else {}
+    done_keys = [k for k in map(functools.partial(_doc_key, docs_dir), docs) if k in done_hashes]
+    done_by_hash = {h: k for k, h in done_hashes.items() if h}
+    groups = _group_duplicates(
+        [d for d in docs if _doc_key(docs_dir, d) not in done_hashes], dedup
+    )
     pending_docs: List[Path] = []
-    completed = 0
-    for doc in docs:
-        out_dir = output_root / f"result_{sample_name}" / doc.stem
-        if out_dir.exists() and _is_output_complete(out_dir, sample_name):
-            completed += 1
-            continue
-        if out_dir.exists():
-            shutil.rmtree(out_dir)
-        pending_docs.append(doc)
+    out_dirs_of: Dict[Path, List[Path]] = {}
+    group_size: Dict[Path, int] = {}
+    on_done: Dict[Path, Optional[Callable[[bool], bool]]] = {}
+    completed = len(done_keys)
+    for content_hash, group in groups.items():
+        doc_keys = [_doc_key(docs_dir, d) for d in group]
+        out_dirs = [_doc_out_dir(output_root, sample_name, docs_dir, d) for d in group]
+        if store:
+            if dedup and content_hash in done_by_hash:
+                store.link(done_by_hash[content_hash], doc_keys)
+                completed += len(group)
+                continue
+            if not export_files:
+                out_dirs = [output_root / ".work" / doc_keys[0]]
+            on_done[group[0]] = functools.partial(
+                _store_result,
+                store,
+                doc_keys,
+                sample_name,
+                out_dirs[0],
+                content_hash if dedup else None,
+                export_files,
+            )
+        else:
+            done = [o for o in out_dirs if o.exists() and _is_output_complete(o, sample_name)]
+            if done:
+                _fan_out(done[0], [o for o in out_dirs if o not in done])
+                completed += len(group)
+                continue
+            on_done[group[0]] = None
+        for o in out_dirs:
+            if o.exists():
+                shutil.rmtree(o)
+        pending_docs.append(group[0])
+        out_dirs_of[group[0]] = out_dirs
+        group_size[group[0]] = len(group)
 
     total = len(docs)
-    remaining = len(pending_docs)
+    remaining = sum(group_size[d] for d in pending_docs)
+    unique = len(set(groups) | {done_hashes[k] or k for k in done_keys})
 
     console = Console()
-    console.print(f"Total docs: {total} | Completed: {completed} | Remaining: {remaining}")
+    console.print(
+        f"Total docs: {total} | Unique: {unique} | "
+        f"Dedup ratio: {total / unique:.2f}x | "
+        f"Completed: {completed} | Remaining: {remaining}"
+    )
     if not pending_docs:
+        if store:
+            store.close()
         console.print("Nothing to process. Exiting.")
         raise typer.Exit()
 
     sem = asyncio.Semaphore(workers)
     loop = asyncio.get_running_loop()
-    executor = ThreadPoolExecutor(max_workers=min(workers, cpu_count()))
+    manager = started = None
+    if executor_kind == "process":
+        # One limiter for all worker processes, served from a manager process.
+        manager = LimiterManager()
+        manager.start(setup_logging_file_only, (output_root / "phen_prior.log", log_level))
+        limiter = manager.RateLimiter(
+            rpm=rpm, tpm=tpm, max_concurrency=llm_concurrency or workers
+        )
+        started = manager.dict()
+        executor = _make_process_pool(
+            min(workers, cpu_count()),
+            max_tasks_per_child,
+            (output_root / "phen_prior.log", log_level, limiter, started),
+        )
+        tail_msg = f"Running in {min(workers, cpu_count())} worker processes"
+    else:
+        # Documents run as coroutines; threads only carry the blocking LLM,
+        # tokenizer and SQLite steps, never a waiting child process.
+        executor = ThreadPoolExecutor(max_workers=workers)
+        loop.set_default_executor(executor)
+        tail_msg = ""
 
     bar_progress = Progress(
         SpinnerColumn(),
@@ -264,8 +584,8 @@ async def _batch_async(
     )
     tail_progress = Progress(TextColumn("{task.description}"), console=console)
 
-    bar_id = bar_progress.add_task("Processing", total=remaining)
-    tail_id = tail_progress.add_task("", total=None)
+    bar_id = bar_progress.add_task("Processing", total=len(pending_docs))
+    tail_id = tail_progress.add_task(tail_msg, total=None)
 
     with Live(Group(bar_progress, tail_progress), console=console, refresh_per_second=10):
         coros = [
@@ -275,18 +595,34 @@ async def _batch_async(
                 executor,
                 doc,
                 sqlite_path,
-                output_root,
+                out_dirs_of[doc][0],
                 api_key,
                 bar_progress,
                 bar_id,
                 tail_progress,
                 tail_id,
+                overlap,
+                out_dirs_of[doc][1:],
+                on_done[doc],
+                prefilter,
+                started,
             )
             for doc in pending_docs
         ]
-        results = await asyncio.gather(*coros)
-
-    failed = results.count(False)
+        try:
+            results = await asyncio.gather(*coros)
+        finally:
+            if isinstance(executor, Pool):
+                executor.terminate()
+                executor.join()
+                manager.shutdown()
+            else:
+                executor.shutdown(wait=False, cancel_futures=True)
+            await remove_run_containers()
+            if store:
+                store.close()
+
+    failed = sum(group_size[d] for d, ok in zip(pending_docs, results) if not ok)
     console.print(f"Finished. OK: {remaining - failed} | Failed: {failed}")
 
 
@@ -298,6 +634,16 @@ def batch(
     config: Optional[Path] = typer.Option(BASE_DIR / "data/tokenizer_config.json", "-c", "--config"),
     log_level: str = typer.Option("info", "--log-level"),
     workers: int = typer.Option(4, "-w", "--workers"),
+    overlap: bool = typer.Option(False, "--overlap"),
+    dedup: bool = typer.Option(True, "--dedup/--no-dedup"),
+    rpm: int = typer.Option(500, "--rpm"),
+    tpm: int = typer.Option(300_000, "--tpm"),
+    llm_concurrency: Optional[int] = typer.Option(None, "--llm-concurrency"),
+    executor_kind: str = typer.Option("thread", "--executor"),
+    max_tasks_per_child: int = typer.Option(20, "--max-tasks-per-child"),
+    use_store: bool = typer.Option(False, "--store/--no-store"),
+    export_files: bool = typer.Option(True, "--export-files/--no-export-files"),
+    prefilter: bool = typer.Option(True, "--prefilter/--no-prefilter"),
 ):
     asyncio.run(
         _batch_async(
@@ -307,10 +653,142 @@ def batch(
             config,
             log_level,
             workers,
+            overlap,
+            dedup,
+            rpm,
+            tpm,
+            llm_concurrency,
+            executor_kind,
+            max_tasks_per_child,
+            use_store,
+            export_files,
+            prefilter,
         )
     )
 
 
+@app.command()
+def export(
+    output_root: Path = typer.Option(..., "-o", "--output-root"),
+    sqlite_path: Optional[Path] = typer.Option(None, "-s", "--sqlite"),
+):
+    store_path = output_root / STORE_NAME
+    check_file_exists(store_path)
+    sample_name = sqlite_path.stem.split(".", 1)[0] if sqlite_path else None
+    store = ResultsStore(store_path)
+    count = store.export(output_root, sample_name)
+    store.close()
+    Console().print(f"Exported {count} documents to {output_root}")
+
+
+async def _serve_async(
+    host: str,
+    port: int,
+    socket_path: Optional[Path],
+    output_root: Path,
+    config: Optional[Path],
+    log_level: str,
+    workers: int,
+    max_queued: int,
+    overlap: bool,
+    prefilter: bool,
+    rpm: int,
+    tpm: int,
+    llm_concurrency: Optional[int],
+):
+    output_root.mkdir(parents=True, exist_ok=True)
+    setup_logging_file_only(output_root / "phen_prior.log", log_level)
+    api_key = load_config(config)
+    configure_rate_limiter(rpm=rpm, tpm=tpm, max_concurrency=llm_concurrency or workers)
+    client = DeepSeekClient(api_key=api_key).client
+    warm_up()
+
+    # Job dirs live under output_root, which both containers mount at /mnt.
+    tagger = PersistentContainer(PHENOTAGGER_IMAGE, output_root)
+    clinprior = PersistentContainer(CLINPRIOR_IMAGE, output_root, platform="linux/amd64")
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers * 2))
+
+    async def _run_job(job: Job):
+        await Pipeline(
+            job.note_path,
+            job.sqlite_path,
+            api_key,
+            job.result_dir,
+            show_progress=False,
+            tail_cb=_discard_tail,
+            overlap=overlap,
+            prefilter=prefilter,
+            client=client,
+            tagger_container=tagger,
+            clinprior_container=clinprior,
+        ).run_async()
+
+    queue = JobQueue(
+        loop,
+        _run_job,
+        output_root / "jobs",
+        workers,
+        max_queued,
+        probes={"phenotagger": tagger.is_alive, "clinprior": clinprior.is_alive},
+    )
+    server = make_server(queue, host, port, socket_path)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    try:
+        await asyncio.gather(tagger.start(), clinprior.start())
+        server_thread.start()
+        where = socket_path or f"http://{host}:{port}"
+        log.info(f"Serving on {where} with {workers} workers")
+        Console().print(f"Serving on {where} (workers: {workers}). Ctrl+C to stop.")
+        await queue.run()
+    finally:
+        if server_thread.is_alive():
+            server.shutdown()
+        server.server_close()
+        if socket_path and socket_path.exists():
+            socket_path.unlink()
+        await asyncio.gather(tagger.stop(), clinprior.stop())
+        await remove_run_containers()
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(8765, "-p", "--port"),
+    socket_path: Optional[Path] = typer.Option(None, "--socket"),
+    output_root: Path = typer.Option(BASE_DIR / "serve_results", "-o", "--output-root"),
+    config: Optional[Path] = typer.Option(BASE_DIR / "data/tokenizer_config.json", "-c", "--config"),
+    log_level: str = typer.Option("info", "--log-level"),
+    workers: int = typer.Option(2, "-w", "--workers"),
+    max_queued: int = typer.Option(100, "--max-queued"),
+    overlap: bool = typer.Option(False, "--overlap"),
+    prefilter: bool = typer.Option(True, "--prefilter/--no-prefilter"),
+    rpm: int = typer.Option(500, "--rpm"),
+    tpm: int = typer.Option(300_000, "--tpm"),
+    llm_concurrency: Optional[int] = typer.Option(None, "--llm-concurrency"),
+):
+    try:
+        asyncio.run(
+            _serve_async(
+                host,
+                port,
+                socket_path,
+                output_root,
+                config,
+                log_level,
+                workers,
+                max_queued,
+                overlap,
+                prefilter,
+                rpm,
+                tpm,
+                llm_concurrency,
+            )
+        )
+    except KeyboardInterrupt:
+        Console().print("Stopped.")
+
+
 @app.command()
 def run(
     med_doc: Path = typer.Option(BASE_DIR / "../med_docs_test/test.txt", "-m", "--med_doc"),
@@ -319,6 +797,8 @@ def run(
     output_dir: Optional[Path] = typer.Option(None, "-o", "--output_dir"),
     log_level: str = typer.Option("info", "--log-level"),
     override: bool = typer.Option(False, "--override"),
+    overlap: bool = typer.Option(False, "--overlap"),
+    prefilter: bool = typer.Option(True, "--prefilter/--no-prefilter"),
 ):
     for p in (med_doc, sqlite_path):
         check_file_exists(p)
@@ -340,13 +820,18 @@ def run(
     setup_logging_file_only(output_dir / "phen_prior.log", log_level)
     api_key = load_config(config)
 
-    Pipeline(
-        med_doc,
-        sqlite_path,
-        api_key,
-        output_dir,
-        show_progress=True,
-    ).run()
+    try:
+        Pipeline(
+            med_doc,
+            sqlite_path,
+            api_key,
+            output_dir,
+            show_progress=True,
+            overlap=overlap,
+            prefilter=prefilter,
+        ).run()
+    finally:
+        asyncio.run(remove_run_containers())
 
 
 if __name__ == "__main__":
@@ -1,14 +1,21 @@
+import asyncio
 import re
-import subprocess
 import time
+import queue
+import threading
 from pathlib import Path
 import os
 import warnings
 import logging
 import shutil
-from typing import Optional
-
-from .utils import log, DeepSeekClient
+import json
+import tempfile
+import uuid
+from functools import lru_cache
+from typing import Optional, List, Tuple, FrozenSet, Callable, Awaitable, Dict
+
+import nltk
+from .utils import log, DeepSeekClient, check_file_exists
 from .text_ops import write_text
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -18,69 +25,391 @@ logging.getLogger("transformers").setLevel(logging.ERROR)
 logging.getLogger("tensorflow").setLevel(logging.ERROR)
 
 DOCKER_TIMEOUT = 60 * 60
+PHENOTAGGER_TIMEOUT = DOCKER_TIMEOUT
+CLINPRIOR_TIMEOUT = DOCKER_TIMEOUT
+PHENOTAGGER_IMAGE = "albertea/phenotagger:1.2"
+CLINPRIOR_IMAGE = "aschluterclinprior/clinprior2:latest"
+WHITELIST_PATH = Path(__file__).resolve().parent.parent / "data" / "hpo_whitelist.txt"
+TAGGER_SERVER_SCRIPT = Path(__file__).resolve().parent.parent / "phenotagger_server.py"
+TAGGER_SERVER_START_TIMEOUT = 600
+
+# Every container started by this run (and its forked workers) carries this
+# label, so leftovers can be removed in one sweep on exit.
+RUN_LABEL = "phen_prior.run"
+RUN_ID = os.environ.setdefault("PHEN_PRIOR_RUN_ID", uuid.uuid4().hex[:12])
+
+_docker_ok = False
+
+NEGATION_CUES = re.compile(
+    r"\b(no|not|without|denie[sd]|absent|absence of|negative for|free of|lack of|never)\b", re.I
+)
+UNCERTAIN_CUES = re.compile(
+    r"\b(possible|possibly|probable|probably|suspected|suspicion|rule out|cannot be excluded|"
+    r"questionable|family history|mother|father|brother|sister|sibling|grandmother|grandfather|"
+    r"aunt|uncle|cousin)\b|\?",
+    re.I,
+)
+
+
+@lru_cache(maxsize=None)
+def load_whitelist() -> FrozenSet[str]:
+    check_file_exists(WHITELIST_PATH)
+    return frozenset(
+        l.strip() for l in WHITELIST_PATH.read_text(encoding="utf-8").splitlines() if l.strip()
+    )
 
 
-def _build_tag_script(sample: str, script_path: Path) -> None:
+def _build_tag_script(sample: str, script_path: Path, mnt: str = "/mnt", token: str = "") -> None:
+    # Private input/output dirs so several runs can share one container; the
+    # token in their names lets a cancelled run be found with pkill -f.
     script_path.write_text(
         f"""#!/usr/bin/bash
 cd /PhenoTagger/src/
-rm -f /PhenoTagger/example/input/*
-cp /mnt/{sample}.PubTator /PhenoTagger/example/input/
-python /PhenoTagger/src/PhenoTagger_tagging.py -i ../example/input/ -o ../output/ || exit 1
+IN=$(mktemp -d /tmp/phen_prior_{token}_in.XXXXXX)
+OUT=$(mktemp -d /tmp/phen_prior_{token}_out.XXXXXX)
+trap 'rm -rf "$IN" "$OUT"' EXIT
+cp {mnt}/{sample}.PubTator "$IN"/
+python /PhenoTagger/src/PhenoTagger_tagging.py -i "$IN"/ -o "$OUT"/ || exit 1
 shopt -s nullglob
-cp ../output/* /mnt/ 2>/dev/null || true
+cp "$OUT"/* {mnt}/ 2>/dev/null || true
 """,
         encoding="utf-8",
     )
 
-def _check_docker() -> None:
+
+async def _run_process(
+    args: List[str],
+    timeout: float,
+    stage: str,
+    on_abort: Optional[Callable[[], Awaitable[None]]] = None,
+) -> Tuple[int, str, str]:
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if proc.returncode is None:
+            proc.kill()
+            await asyncio.shield(proc.wait())
+        if on_abort:
+            await asyncio.shield(on_abort())
+        if isinstance(e, asyncio.TimeoutError):
+            raise RuntimeError(f"{stage} timed out after {timeout:.0f}s") from None
+        raise
+    return proc.returncode, out.decode(errors="replace"), err.decode(errors="replace")
+
+
+async def _remove_container(name: str) -> None:
+    proc = await asyncio.create_subprocess_exec(
+        "docker",
+        "rm",
+        "-f",
+        name,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    await proc.wait()
+    log.info(f"Container {name} removed")
+
+
+async def _check_docker() -> None:
+    global _docker_ok
+    if _docker_ok:
+        return
     if shutil.which("docker") is None:
         raise RuntimeError("Docker binary not found in PATH")
-    subprocess.check_output(["docker", "info"], stderr=subprocess.STDOUT, timeout=5)
+    rc, _, err = await _run_process(["docker", "info"], 5, "docker info")
+    if rc != 0:
+        raise RuntimeError(f"Docker is not available: {err.strip()}")
+    _docker_ok = True
 
 
-def execute_phenotagger(text: str, sample_name: str, result_dir: Path) -> str:
-    _check_docker()
+async def remove_run_containers() -> None:
+    if shutil.which("docker") is None:
+        return
+    _, out, _ = await _run_process(
+        ["docker", "ps", "-aq", "--filter", f"label={RUN_LABEL}={RUN_ID}"], 30, "docker ps"
+    )
+    ids = out.split()
+    if ids:
+        await _run_process(["docker", "rm", "-f", *ids], 60, "docker rm")
+        log.info(f"Removed {len(ids)} leftover container(s)")
+
+
+class PersistentContainer:
+    """A detached container kept alive so repeated runs can `docker exec` into it.
+
+    `mount_dir` is mounted at /mnt; paths passed to `path_in` must live under it.
+    If the container exits after `start`, the next `exec` starts it again.
+    """
+
+    def __init__(
+        self,
+        image: str,
+        mount_dir: Path,
+        name: Optional[str] = None,
+        platform: Optional[str] = None,
+    ):
+        self.image = image
+        self.mount_dir = mount_dir.resolve()
+        self.name = name or f"phen_prior_{uuid.uuid4().hex[:12]}"
+        self.platform = platform
+        self.running = False
+        # A thread lock: the container may be shared by event loops in other threads.
+        self._restart_lock = threading.Lock()
+
+    async def start(self) -> None:
+        await _check_docker()
+        cmd = [
+            "docker",
+            "run",
+            "-d",
+            "--rm",
+            *(["--platform", self.platform] if self.platform else []),
+            "--user",
+            "root",
+            "--name",
+            self.name,
+            "--label",
+            f"{RUN_LABEL}={RUN_ID}",
+            "-v",
+            f"{self.mount_dir}:/mnt",
+            "--entrypoint",
+            "sleep",
+            self.image,
+            "infinity",
+        ]
+        rc, _, err = await _run_process(
+            cmd, 300, f"{self.image} start", lambda: _remove_container(self.name)
+        )
+        if rc != 0:
+            raise RuntimeError(f"Failed to start {self.image}: {err.strip()}")
+        self.running = True
+        log.info(f"Container {self.name} started ({self.image})")
+
+    async def is_alive(self) -> bool:
+        rc, out, _ = await _run_process(
+            ["docker", "inspect", "-f", "{{.State.Running}}", self.name], 30, "docker inspect"
+        )
+        return rc == 0 and out.strip() == "true"
+
+    async def ensure_running(self) -> None:
+        if not self.running:
+            raise RuntimeError(f"Container {self.name} is not started")
+        if await self.is_alive():
+            return
+        await asyncio.to_thread(self._restart_lock.acquire)
+        try:
+            if not await self.is_alive():
+                log.warning(f"Container {self.name} is gone; restarting it")
+                await _remove_container(self.name)
+                await self.start()
+        finally:
+            self._restart_lock.release()
+
+    def path_in(self, host_path: Path) -> str:
+        rel = host_path.resolve().relative_to(self.mount_dir).as_posix()
+        return "/mnt" if rel == "." else f"/mnt/{rel}"
+
+    async def exec(
+        self,
+        args: List[str],
+        timeout: float,
+        stage: str,
+        kill_pattern: Optional[str] = None,
+    ) -> Tuple[int, str, str]:
+        async def _kill():
+            # Killing the docker client leaves the exec'd process running.
+            if kill_pattern:
+                await _run_process(
+                    ["docker", "exec", self.name, "pkill", "-f", kill_pattern], 30, "pkill"
+                )
+
+        await self.ensure_running()
+        return await _run_process(["docker", "exec", self.name, *args], timeout, stage, _kill)
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        await _remove_container(self.name)
+
+
+class TaggerServer:
+    """One PhenoTagger process inside a PersistentContainer, model loaded once.
+
+    Runs `phenotagger_server.py` via `docker exec -i` and feeds it one run per
+    stdin line; runs are served one at a time. `work_dir` must be under the
+    container's mount.
+    """
+
+    def __init__(self, container: PersistentContainer, work_dir: Path):
+        self.container = container
+        self.work_dir = work_dir
+        self.script = work_dir / TAGGER_SERVER_SCRIPT.name
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self._log = None
+
+    async def start(self) -> None:
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy(TAGGER_SERVER_SCRIPT, self.script)
+        await self.container.ensure_running()
+        self._log = open(self.work_dir / "tagger_server.log", "wb")
+        self.proc = await asyncio.create_subprocess_exec(
+            "docker",
+            "exec",
+            "-i",
+            self.container.name,
+            "python",
+            self.container.path_in(self.script),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=self._log,
+        )
+        t0 = time.time()
+        await self._reply(TAGGER_SERVER_START_TIMEOUT, "PhenoTagger server start")
+        log.info(f"PhenoTagger server ready in {time.time() - t0:.1f}s (model loaded)")
+
+    async def tag(self, pubtator: Path, timeout: float) -> None:
+        """Tag `pubtator`; outputs land next to it, as with the one-shot script."""
+        if not self.proc or self.proc.returncode is not None:
+            raise RuntimeError("PhenoTagger server is not running")
+        run_dir = Path(tempfile.mkdtemp(prefix="run_", dir=self.work_dir))
+        try:
+            (run_dir / "in").mkdir()
+            (run_dir / "out").mkdir()
+            shutil.copy(pubtator, run_dir / "in")
+            req = {
+                "in": self.container.path_in(run_dir / "in"),
+                "out": self.container.path_in(run_dir / "out"),
+            }
+            self.proc.stdin.write((json.dumps(req) + "\n").encode())
+            await self.proc.stdin.drain()
+            await self._reply(timeout, "PhenoTagger")
+            for f in (run_dir / "out").iterdir():
+                shutil.copy(f, pubtator.parent / f.name)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    async def stop(self, graceful: bool = True) -> None:
+        """Close stdin so an idle server exits; kill it if it does not (or if not graceful)."""
+        if self.proc and self.proc.returncode is None:
+            self.proc.stdin.close()
+            if not graceful or not await self._exited(10):
+                self.proc.kill()
+                # Killing the docker client leaves the server running in the container.
+                await _run_process(
+                    ["docker", "exec", self.container.name, "pkill", "-f", self.container.path_in(self.script)],
+                    30,
+                    "pkill",
+                )
+                await self._exited(30)
+        if self._log:
+            self._log.close()
+            self._log = None
+
+    async def _exited(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.proc.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _reply(self, timeout: float, stage: str) -> None:
+        try:
+            line = await asyncio.wait_for(self.proc.stdout.readline(), timeout)
+        except BaseException as e:
+            await asyncio.shield(self.stop(graceful=False))
+            if isinstance(e, asyncio.TimeoutError):
+                raise RuntimeError(f"{stage} timed out after {timeout:.0f}s") from None
+            raise
+        if not line:
+            await self.stop(graceful=False)
+            raise RuntimeError(f"{stage}: server exited (see {self.work_dir / 'tagger_server.log'})")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise RuntimeError(f"{stage} failed: {reply.get('error', '').strip()}")
+
+
+def _parse_tagger_hits(pubtator: Path) -> str:
+    # Annotation lines of the single document, as "*mention*\tHP:XXXXXXX".
+    lines = [l for l in pubtator.read_text(encoding="utf-8").splitlines() if l.startswith("1")]
+    hits = []
+    for line in lines[2:]:
+        cols = line.split("\t")[3:5]
+        if len(cols) == 2 and cols[1].startswith("HP:"):
+            hits.append(f"*{cols[0]}*\t{cols[1]}")
+        elif cols:
+            hits.append("*" + "\t".join(cols))
+    return "\n".join(hits).strip()
+
+
+async def execute_phenotagger(
+    text: str,
+    sample_name: str,
+    result_dir: Path,
+    require_hits: bool = True,
+    container: Optional[PersistentContainer] = None,
+    server: Optional[TaggerServer] = None,
+) -> str:
+    await _check_docker()
 
     input_pubtator = result_dir / f"{sample_name}.PubTator"
     input_pubtator.write_text(f"1|t|description\n1|a|{text}\n\n\n", encoding="utf-8")
 
+    token = uuid.uuid4().hex[:12]
+    mnt = container.path_in(result_dir) if container else "/mnt"
     script_path = result_dir / f"{sample_name}.sh"
-    _build_tag_script(sample_name, script_path)
-    subprocess.run(["chmod", "+x", script_path.as_posix()], check=True)
-
-    cmd = [
-        "docker",
-        "run",
-        "--user",
-        "root",
-        "--rm",
-        "-v",
-        f"{result_dir.resolve()}:/mnt",
-        "albertea/phenotagger:1.2",
-        f"/mnt/{script_path.name}",
-        "--gpus",
-        "all",
-    ]
+    if not server:
+        _build_tag_script(sample_name, script_path, mnt, token)
+        script_path.chmod(0o755)
 
     start = time.time()
-    proc = subprocess.run(cmd, capture_output=True, text=True, timeout=DOCKER_TIMEOUT)
+    if server:
+        await server.tag(input_pubtator, PHENOTAGGER_TIMEOUT)
+        rc, err = 0, ""
+    elif container:
+        rc, _, err = await container.exec(
+            [f"{mnt}/{script_path.name}"],
+            PHENOTAGGER_TIMEOUT,
+            "PhenoTagger",
+            kill_pattern=f"phen_prior_{token}",
+        )
+    else:
+        name = f"phen_prior_tagger_{token}"
+        cmd = [
+            "docker",
+            "run",
+            "--user",
+            "root",
+            "--rm",
+            "--name",
+            name,
+            "--label",
+            f"{RUN_LABEL}={RUN_ID}",
+            "-v",
+            f"{result_dir.resolve()}:/mnt",
+            PHENOTAGGER_IMAGE,
+            f"/mnt/{script_path.name}",
+            "--gpus",
+            "all",
+        ]
+        rc, _, err = await _run_process(
+            cmd, PHENOTAGGER_TIMEOUT, "PhenoTagger", lambda: _remove_container(name)
+        )
     runtime = time.time() - start
-    log.info(f"PhenoTagger finished in {runtime:.1f}s (rc={proc.returncode})")
+    log.info(f"PhenoTagger finished in {runtime:.1f}s (rc={rc})")
 
-    if proc.returncode != 0:
-        raise RuntimeError(f"PhenoTagger failed: {proc.stderr.strip()}")
+    if rc != 0:
+        raise RuntimeError(f"PhenoTagger failed: {err.strip()}")
 
-    parse_cmd = (
-        f'grep "^1" {input_pubtator.name} | sed "1,2d" | cut -f4,5 | '
-        'sed "s+^+*+" | sed "s+\\tHP:+*\\tHP:+"'
-    )
     try:
-        hpo = subprocess.check_output(parse_cmd, shell=True, cwd=result_dir).decode().strip()
-    except subprocess.CalledProcessError:
+        hpo = _parse_tagger_hits(input_pubtator)
+    except (OSError, UnicodeDecodeError):
         raise RuntimeError("Failed to parse PhenoTagger output")
 
-    if not hpo:
+    if not hpo and require_hits:
         raise RuntimeError("PhenoTagger returned no HPO terms")
 
     (result_dir / f"{sample_name}_03_raw_hpo.txt").write_text(hpo, encoding="utf-8")
@@ -100,24 +429,299 @@ def execute_phenotagger(text: str, sample_name: str, result_dir: Path) -> str:
     return hpo
 
 
-
-def get_hpo(text: str, chat: DeepSeekClient, sample_name: str, result_dir: Path) -> str:
+def _merge_pubtator(parts: List[Tuple[str, Path]], dst: Path) -> None:
+    abstract = ""
+    annotations = []
+    for text, path in parts:
+        shift = len(abstract) + (1 if abstract else 0)
+        abstract = f"{abstract} {text}" if abstract else text
+        if not path.exists():
+            continue
+        for line in path.read_text(encoding="utf-8").splitlines():
+            cols = line.split("\t")
+            if len(cols) < 4 or not (cols[1].isdigit() and cols[2].isdigit()):
+                continue
+            cols[1] = str(int(cols[1]) + shift)
+            cols[2] = str(int(cols[2]) + shift)
+            annotations.append("\t".join(cols))
+    body = "\n".join(annotations)
+    dst.write_text(f"1|t|description\n1|a|{abstract}\n{body}\n\n\n", encoding="utf-8")
+
+
+class TaggingWorker:
+    """Runs PhenoTagger on sentences as they arrive from the translation stream.
+
+    Sentences queued while a tagger run is in flight are batched into the next
+    run, so by the time the LLM finishes only the last chunk is left to tag.
+    The container and a TaggerServer holding the loaded model are started
+    as soon as the worker is created, while the LLM is still streaming, so
+    each chunk only pays PhenoTagger's inference. If the server cannot start,
+    every chunk falls back to a one-shot `docker exec` run. A `container`
+    passed in (e.g. by `serve`) is reused and left running.
+    """
+
+    def __init__(
+        self,
+        sample_name: str,
+        result_dir: Path,
+        min_chars: int = 1500,
+        container: Optional[PersistentContainer] = None,
+    ):
+        self.sample_name = sample_name
+        self.result_dir = result_dir
+        self.min_chars = min_chars
+        self.parts: List[Tuple[str, str, Path]] = []
+        self.stale = False
+        self.error: Optional[BaseException] = None
+        self.stream_dir = result_dir / "stream"
+        self._container = container
+        self._owns_container = container is None
+        self._server: Optional[TaggerServer] = None
+        self._aloop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, sentence: str):
+        self._queue.put(sentence)
+
+    def reset(self):
+        log.warning("Translation stream restarted; tagging will rerun on the final text")
+        self.stale = True
+
+    async def abort(self):
+        """Stop tagging now: cancel the run in flight and wait for the thread."""
+        self.stale = True
+        self._queue.put(None)
+        if self._aloop and self._task:
+            # Cancelling kills the docker exec and pkills the tagger inside.
+            self._aloop.call_soon_threadsafe(self._task.cancel)
+        await asyncio.to_thread(self._thread.join)
+
+    def finish(self) -> Optional[str]:
+        """Wait for the last chunk; None means the caller must tag the full text."""
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            if self.error:
+                log.warning(f"Streamed tagging failed ({self.error}); rerunning on the final text")
+            if self.stale or self.error:
+                return None
+            return self._merge()
+        finally:
+            shutil.rmtree(self.stream_dir, ignore_errors=True)
+
+    def _loop(self):
+        aloop = self._aloop = asyncio.new_event_loop()
+        try:
+            self._task = aloop.create_task(self._start())
+            try:
+                aloop.run_until_complete(self._task)
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                self.error = e
+            self._consume(aloop)
+        finally:
+            if self._server:
+                aloop.run_until_complete(self._server.stop())
+            if self._container and self._owns_container:
+                aloop.run_until_complete(self._container.stop())
+            aloop.close()
+            if self.stale:
+                shutil.rmtree(self.stream_dir, ignore_errors=True)
+
+    def _consume(self, aloop: asyncio.AbstractEventLoop):
+        pending: List[str] = []
+        closing = False
+        while not closing:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = None in items
+            pending.extend(i for i in items if i is not None)
+            if self.stale or self.error:
+                pending.clear()
+                continue
+            if pending and (closing or sum(len(p) for p in pending) >= self.min_chars):
+                chunk = " ".join(pending).replace("\n", " ")
+                pending = []
+                self._task = aloop.create_task(self._tag(chunk))
+                try:
+                    aloop.run_until_complete(self._task)
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    self.error = e
+
+    async def _start(self):
+        self.stream_dir.mkdir(parents=True, exist_ok=True)
+        if self._container is None:
+            self._container = PersistentContainer(PHENOTAGGER_IMAGE, self.stream_dir)
+            await self._container.start()
+        server = TaggerServer(self._container, self.stream_dir / "server")
+        try:
+            await server.start()
+            self._server = server
+        except Exception as e:
+            await server.stop(graceful=False)
+            log.warning(f"PhenoTagger server unavailable ({e}); tagging each chunk with a new run")
+
+    async def _tag(self, chunk: str):
+        part_dir = self.stream_dir / f"part{len(self.parts):03d}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        log.info(f"Streamed tagging: part {len(self.parts)} ({len(chunk)} chars)")
+        hpo = await execute_phenotagger(
+            chunk,
+            self.sample_name,
+            part_dir,
+            require_hits=False,
+            container=self._container,
+            server=self._server,
+        )
+        self.parts.append((chunk, hpo, part_dir))
+
+    def _merge(self) -> str:
+        hpo = "\n".join(h for _, h, _ in self.parts if h)
+        if not hpo:
+            raise RuntimeError("PhenoTagger returned no HPO terms")
+        (self.result_dir / f"{self.sample_name}_03_raw_hpo.txt").write_text(hpo, encoding="utf-8")
+        for suffix in ("_03_phenotagger.PubTator", "_03_phenotagger.neg2.PubTator"):
+            sources = [(t, d / f"{self.sample_name}{suffix}") for t, _, d in self.parts]
+            if any(p.exists() for _, p in sources):
+                _merge_pubtator(sources, self.result_dir / f"{self.sample_name}{suffix}")
+        return hpo
+
+
+async def get_hpo(
+    text: str,
+    chat: DeepSeekClient,
+    sample_name: str,
+    result_dir: Path,
+    tagger: Optional[TaggingWorker] = None,
+    container: Optional[PersistentContainer] = None,
+) -> str:
     text = text.replace("\n", " ")
-    hpo = execute_phenotagger(text, sample_name, result_dir)
+    hpo = await asyncio.to_thread(tagger.finish) if tagger else None
+    if hpo is None:
+        hpo = await execute_phenotagger(text, sample_name, result_dir, container=container)
     write_text(hpo, "_03_hpo_terms", sample_name, result_dir)
     return hpo
 
 
+def _neg2_flags(neg2: Path) -> Dict[str, List[bool]]:
+    flags: Dict[str, List[bool]] = {}
+    if not neg2.exists():
+        return flags
+    for line in neg2.read_text(encoding="utf-8").splitlines():
+        cols = line.split("\t")
+        ids = [i for i, c in enumerate(cols) if re.fullmatch(r"HP:\d{7}", c)]
+        if len(cols) < 5 or not ids:
+            continue
+        extra = cols[ids[0] + 1 :]
+        flags.setdefault(cols[ids[0]], []).append(any("neg" in c.lower() for c in extra))
+    return flags
+
+
+def _mention_contexts(mention: str, sentences: List[str]) -> List[Tuple[int, str]]:
+    found = []
+    for i, sent in enumerate(sentences):
+        pos = sent.lower().find(mention.lower())
+        if pos < 0:
+            continue
+        clause = re.split(r"[,;:]|\b(?:but|however|and|with)\b", sent[:pos], flags=re.I)[-1]
+        window = " ".join(clause.split()[-6:])
+        if NEGATION_CUES.search(window):
+            found.append((i, "negated"))
+        elif UNCERTAIN_CUES.search(sent):
+            found.append((i, "uncertain"))
+        else:
+            found.append((i, "affirmed"))
+    return found
+
+
+def prefilter_terms(
+    hpo_terms: str,
+    text: str,
+    sample_name: str,
+    result_dir: Path,
+) -> Tuple[List[str], str, str]:
+    """Settle unambiguous terms locally.
+
+    Returns the kept "Term name HP:XXXXXXX" lines, the ambiguous part of the
+    tagger list and the sentences the LLM needs to judge it.
+    """
+    whitelist = load_whitelist()
+    neg_flags = _neg2_flags(result_dir / f"{sample_name}_03_phenotagger.neg2.PubTator")
+    sentences = nltk.sent_tokenize(text)
+
+    mentions: Dict[str, List[str]] = {}
+    for line in hpo_terms.splitlines():
+        code = re.search(r"HP:\d{7}", line)
+        if code:
+            mentions.setdefault(code.group(), []).append(line.split("\t")[0].strip("* "))
+
+    kept, ambiguous, audit = [], [], []
+    needed = set()
+    unlocated = False
+    ambiguous_codes = 0
+    for code, names in mentions.items():
+        names = list(dict.fromkeys(n for n in names if n))
+        contexts = [c for n in names for c in _mention_contexts(n, sentences)]
+        states = {state for _, state in contexts}
+        flags = neg_flags.get(code, [])
+        # Only PhenoTagger's own negation flags reject a term; text cues are
+        # too coarse for that and just send it to the LLM.
+        if code not in whitelist:
+            decision, reason = "rejected", "not in whitelist"
+        elif flags and all(flags):
+            decision, reason = "rejected", "negated (PhenoTagger)"
+        elif not contexts:
+            decision, reason = "ambiguous", "mention not found in text"
+            unlocated = True
+        elif states == {"affirmed"} and not any(flags):
+            decision, reason = "kept", "affirmed"
+        else:
+            decision, reason = "ambiguous", "/".join(
+                sorted(states | ({"negated (PhenoTagger)"} if any(flags) else set()))
+            )
+        audit.append(f"{code}\t{'; '.join(names)}\t{decision}\t{reason}")
+        if decision == "kept":
+            kept.append(f"{names[0] if names else code} {code}")
+        elif decision == "ambiguous":
+            ambiguous_codes += 1
+            ambiguous.extend(f"*{n}*\t{code}" for n in names or [code])
+            needed.update(i for i, _ in contexts)
+
+    write_text("\n".join(audit), "_04_prefilter", sample_name, result_dir)
+    log.info(
+        f"Pre-filter: {len(kept)} kept, {len(mentions) - len(kept) - ambiguous_codes} rejected, "
+        f"{ambiguous_codes} sent to LLM"
+    )
+    # A mention the tagger normalised beyond string matching needs the whole text.
+    relevant = text if unlocated or not needed else " ".join(sentences[i] for i in sorted(needed))
+    return kept, "\n".join(ambiguous), relevant
+
+
 def filter_terms(
     hpo_terms: str,
     text: str,
     chat: DeepSeekClient,
     sample_name: str,
     result_dir: Path,
+    prefilter: bool = True,
 ) -> Optional[str]:
     if not hpo_terms:
         raise ValueError("Empty HPO term list")
 
+    kept: List[str] = []
+    if prefilter:
+        kept, hpo_terms, text = prefilter_terms(hpo_terms, text, sample_name, result_dir)
+
     prompt = (
         "Analyze the patient text and match it with the provided HPO term list.\n"
         "Rules:\n"
@@ -126,13 +730,23 @@ def filter_terms(
         "3. Remove terms that do not describe the patient.\n"
         '4. Output each kept term on its own line as "Term name HP:XXXXXXX".'
     )
-    response = chat.ask(f"{text}\n\nHPO term list:\n{hpo_terms}", prompt, temperature=0.0)
+    response = "\n".join(kept)
+    if hpo_terms:
+        answer = chat.ask(f"{text}\n\nHPO term list:\n{hpo_terms}", prompt, temperature=0.0)
+        response = f"{response}\n{answer}".strip()
+    else:
+        log.info("Pre-filter settled every term; LLM filtering skipped")
     write_text(response, "_04_filtered_terms", sample_name, result_dir)
     codes = re.findall(r"HP:\d{7}", response)
     return ",".join(dict.fromkeys(codes)) if codes else None
 
 
-def execute_clinprior(terms: str, sample_name: str, result_dir: Path) -> None:
+async def execute_clinprior(
+    terms: str,
+    sample_name: str,
+    result_dir: Path,
+    container: Optional[PersistentContainer] = None,
+) -> None:
     if not terms:
         raise ValueError("No HPO terms for ClinPrior")
 
@@ -140,31 +754,55 @@ def execute_clinprior(terms: str, sample_name: str, result_dir: Path) -> None:
     if not r_script.exists():
         raise FileNotFoundError(f"R-script not found: {r_script}")
 
-    log.info("ClinPrior: docker run started")
+    await _check_docker()
+    log.info(f"ClinPrior: docker {'exec' if container else 'run'} started")
     t0 = time.time()
 
+    if container:
+        mnt = container.path_in(result_dir)
+        rc, _, err = await container.exec(
+            ["Rscript", f"{mnt}/{r_script.name}", terms, sample_name, mnt],
+            CLINPRIOR_TIMEOUT,
+            "ClinPrior",
+            kill_pattern=f"{mnt}/{r_script.name}",
+        )
+    else:
+        rc, err = await _run_clinprior_container(terms, sample_name, result_dir, r_script)
+    runtime = time.time() - t0
+    log.info(f"ClinPrior finished in {runtime:.1f}s (rc={rc})")
+
+    if rc != 0:
+        raise RuntimeError(f"ClinPrior failed: {err.strip()}")
+
+    csv_path = result_dir / f"{sample_name}_clinprior.csv"
+    if not csv_path.exists():
+        raise FileNotFoundError(f"ClinPrior CSV not found: {csv_path}")
+    csv_path.rename(result_dir / f"{sample_name}_05_clinprior.csv")
+
+
+async def _run_clinprior_container(
+    terms: str, sample_name: str, result_dir: Path, r_script: Path
+) -> Tuple[int, str]:
+    name = f"phen_prior_clinprior_{uuid.uuid4().hex[:12]}"
     cmd = [
         "docker",
         "run",
         "--platform",
         "linux/amd64",
         "--rm",
+        "--name",
+        name,
+        "--label",
+        f"{RUN_LABEL}={RUN_ID}",
         "-v",
         f"{result_dir.resolve()}:/mnt",
-        "aschluterclinprior/clinprior2:latest",
+        CLINPRIOR_IMAGE,
         "bash",
         "-c",
         f"Rscript /mnt/{r_script.name} {terms} {sample_name}",
     ]
 
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    runtime = time.time() - t0
-    log.info(f"ClinPrior finished in {runtime:.1f}s (rc={proc.returncode})")
-
-    if proc.returncode != 0:
-        raise RuntimeError(f"ClinPrior failed: {proc.stderr.strip()}")
-
-    csv_path = result_dir / f"{sample_name}_clinprior.csv"
-    if not csv_path.exists():
-        raise FileNotFoundError(f"ClinPrior CSV not found: {csv_path}")
-    csv_path.rename(result_dir / f"{sample_name}_05_clinprior.csv")
+    rc, _, err = await _run_process(
+        cmd, CLINPRIOR_TIMEOUT, "ClinPrior", lambda: _remove_container(name)
+    )
+    return rc, err
@@ -0,0 +1,11 @@
+# modules/resources.py
+import nltk
+from .text_ops import tokenizer, ensure_punkt
+from .hpo_ops import load_whitelist
+
+def warm_up():
+    """Load the read-only resources pipelines share before workers are forked."""
+    ensure_punkt()
+    nltk.sent_tokenize("Warm up.")
+    load_whitelist()
+    tokenizer.encode("warm up")
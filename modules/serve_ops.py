@@ -0,0 +1,218 @@
+# modules/serve_ops.py
+import asyncio
+import json
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .utils import log
+
+
+class Job:
+    def __init__(self, note_path: Path, sqlite_path: Path, result_dir: Path, job_id: str):
+        self.id = job_id
+        self.note_path = note_path
+        self.sqlite_path = sqlite_path
+        self.result_dir = result_dir
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.lock_key = str(sqlite_path.resolve())
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "note_path": str(self.note_path),
+            "sqlite_path": str(self.sqlite_path),
+            "result_dir": str(self.result_dir),
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """Bounded job queue running at most `concurrency` pipelines at once.
+
+    `submit` may be called from HTTP handler threads. Jobs touching the same
+    variant SQLite file run one at a time; a job waiting on its file never
+    holds a slot that a job for another file could use.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        runner: Callable[[Job], Awaitable[None]],
+        jobs_dir: Path,
+        concurrency: int = 2,
+        max_queued: int = 100,
+        probes: Optional[Dict[str, Callable[[], Awaitable[bool]]]] = None,
+    ):
+        self.loop = loop
+        self.runner = runner
+        self.jobs_dir = jobs_dir
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.probes = probes or {}
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._waiting: List[Job] = []
+        self._busy: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def pending(self) -> int:
+        return sum(j.status == "queued" for j in self.jobs.values())
+
+    def submit(self, sqlite_path: Path, note: Optional[str] = None, note_path: Optional[Path] = None) -> Job:
+        with self._lock:
+            if self.pending() >= self.max_queued:
+                raise OverflowError("Job queue is full")
+            job_id = uuid.uuid4().hex[:12]
+            result_dir = self.jobs_dir / job_id
+            result_dir.mkdir(parents=True)
+            if note is not None:
+                note_path = result_dir / "note.txt"
+                note_path.write_text(note, encoding="utf-8")
+            job = Job(note_path, sqlite_path, result_dir, job_id)
+            self.jobs[job_id] = job
+        self.loop.call_soon_threadsafe(self._enqueue, job)
+        log.info(f"Job {job_id} queued ({note_path})")
+        return job
+
+    def health(self) -> dict:
+        """Called from handler threads; probes run on the queue's loop."""
+        containers = {}
+        for name, probe in self.probes.items():
+            try:
+                alive = asyncio.run_coroutine_threadsafe(probe(), self.loop).result(60)
+            except Exception:
+                alive = False
+            containers[name] = "running" if alive else "down"
+        ok = all(state == "running" for state in containers.values())
+        return {
+            "status": "ok" if ok else "degraded",
+            "queued": self.pending(),
+            "running": len(self._tasks),
+            "containers": containers,
+        }
+
+    async def run(self):
+        """Dispatch jobs until cancelled; running jobs are cancelled with it."""
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _enqueue(self, job: Job):
+        self._waiting.append(job)
+        self._dispatch()
+
+    def _dispatch(self):
+        for job in list(self._waiting):
+            if len(self._tasks) >= self.concurrency:
+                break
+            if job.lock_key in self._busy:
+                continue
+            self._waiting.remove(job)
+            self._busy.add(job.lock_key)
+            task = self.loop.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._job_done(job))
+
+    def _job_done(self, job: Job):
+        def _done(task: asyncio.Task):
+            self._tasks.discard(task)
+            self._busy.discard(job.lock_key)
+            self._dispatch()
+
+        return _done
+
+    async def _run_job(self, job: Job):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            await self.runner(job)
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status, job.error, job.finished = "failed", "Server shut down", time.time()
+            raise
+        except (Exception, SystemExit) as e:
+            job.status = "failed"
+            job.error = f"Pipeline exited with code {e.code}" if isinstance(e, SystemExit) else str(e)
+            (job.result_dir / "error.txt").write_text(job.error)
+            log.error(f"Job {job.id} failed: {job.error}")
+        job.finished = time.time()
+        log.info(f"Job {job.id} {job.status} in {job.finished - job.started:.1f}s")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    queue: JobQueue
+
+    def _send(self, code: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if parts == ["health"]:
+            health = self.queue.health()
+            return self._send(200 if health["status"] == "ok" else 503, health)
+        if parts == ["jobs"]:
+            return self._send(200, {"jobs": [j.to_dict() for j in self.queue.jobs.values()]})
+        if len(parts) == 2 and parts[0] == "jobs" and parts[1] in self.queue.jobs:
+            return self._send(200, self.queue.jobs[parts[1]].to_dict())
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            sqlite_path = Path(body["sqlite_path"])
+            note, note_path = body.get("note"), body.get("note_path")
+            if note is None and note_path is None:
+                raise KeyError("note")
+        except (ValueError, KeyError) as e:
+            return self._send(400, {"error": f"bad request: {e}"})
+        for p in (sqlite_path, Path(note_path) if note_path else None):
+            if p is not None and not p.exists():
+                return self._send(400, {"error": f"file not found: {p}"})
+        try:
+            job = self.queue.submit(sqlite_path, note, Path(note_path) if note_path else None)
+        except OverflowError as e:
+            return self._send(429, {"error": str(e)})
+        self._send(202, job.to_dict())
+
+    def log_message(self, format: str, *args):
+        log.debug("serve: " + format % args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def make_server(queue: JobQueue, host: str, port: int, socket_path: Optional[Path] = None):
+    handler = type("JobHandler", (_Handler,), {"queue": queue})
+    if socket_path:
+        if socket_path.exists():
+            socket_path.unlink()
+        return _UnixHTTPServer(str(socket_path), handler)
+    return ThreadingHTTPServer((host, port), handler)
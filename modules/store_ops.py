@@ -0,0 +1,198 @@
+# modules/store_ops.py
+import io
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from .utils import log
+
+STORE_NAME = "phen_prior_results.sqlite"
+STAGES = [
+    ("processed", "_02_processed_text.txt"),
+    ("hpo", "_03_hpo_terms.txt"),
+    ("filtered", "_04_filtered_terms.txt"),
+    ("clinprior", "_05_clinprior.csv"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    sample TEXT NOT NULL,
+    content_hash TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_sample_status ON documents (sample, status);
+CREATE TABLE IF NOT EXISTS texts (
+    doc_key TEXT PRIMARY KEY,
+    processed_text TEXT
+);
+CREATE TABLE IF NOT EXISTS hpo_terms (
+    doc_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    hpo_id TEXT NOT NULL,
+    mention TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_hpo_terms_doc ON hpo_terms (doc_key);
+CREATE INDEX IF NOT EXISTS idx_hpo_terms_id ON hpo_terms (hpo_id, kind);
+CREATE TABLE IF NOT EXISTS gene_ranks (
+    doc_key TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    symbol TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_gene_ranks_doc ON gene_ranks (doc_key);
+CREATE INDEX IF NOT EXISTS idx_gene_ranks_symbol ON gene_ranks (symbol);
+CREATE TABLE IF NOT EXISTS files (
+    doc_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    content BLOB,
+    PRIMARY KEY (doc_key, name)
+);
+"""
+
+TABLES = ["documents", "texts", "hpo_terms", "gene_ranks", "files"]
+
+
+def _read(files: dict, name: str) -> str:
+    return files[name].decode("utf-8", errors="replace") if name in files else ""
+
+
+class ResultsStore:
+    """Single SQLite database holding per-document status and outputs of a batch.
+
+    Only the batch parent process writes to it, after each document finishes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def completed(self, sample: str) -> Dict[str, Optional[str]]:
+        """Map doc_key -> content_hash of the sample's finished documents."""
+        rows = self.conn.execute(
+            "SELECT doc_key, content_hash FROM documents WHERE sample = ? AND status = 'done';",
+            (sample,),
+        )
+        return dict(rows.fetchall())
+
+    def mark_failed(
+        self,
+        doc_keys: List[str],
+        sample: str,
+        error: str,
+        content_hash: Optional[str] = None,
+    ):
+        with self.conn:
+            self._delete(doc_keys)
+            self.conn.executemany(
+                "INSERT INTO documents VALUES (?, ?, ?, 'failed', NULL, ?, ?);",
+                [(k, sample, content_hash, error, time.time()) for k in doc_keys],
+            )
+
+    def ingest(
+        self,
+        doc_keys: List[str],
+        sample: str,
+        result_dir: Path,
+        ok: bool,
+        content_hash: Optional[str] = None,
+    ):
+        files = (
+            {p.name: p.read_bytes() for p in result_dir.iterdir() if p.is_file()}
+            if result_dir.exists()
+            else {}
+        )
+        stage = None
+        for name, suffix in STAGES:
+            if f"{sample}{suffix}" in files:
+                stage = name
+        raw = [
+            (l.split("\t")[1].strip(), l.split("\t")[0].strip("*"))
+            for l in _read(files, f"{sample}_03_hpo_terms.txt").splitlines()
+            if "\t" in l
+        ]
+        filtered = [
+            (m.group(2), m.group(1).strip())
+            for m in re.finditer(r"^(.*?)(HP:\d{7})", _read(files, f"{sample}_04_filtered_terms.txt"), re.M)
+        ]
+        genes: List[str] = []
+        csv_name = f"{sample}_05_clinprior.csv"
+        if csv_name in files:
+            genes = pd.read_csv(io.BytesIO(files[csv_name]))["Symbol"].astype(str).tolist()
+        with self.conn:
+            self._delete(doc_keys)
+            for key in doc_keys:
+                self.conn.execute(
+                    "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?);",
+                    (
+                        key,
+                        sample,
+                        content_hash,
+                        "done" if ok else "failed",
+                        stage,
+                        _read(files, "error.txt") or None,
+                        time.time(),
+                    ),
+                )
+                self.conn.execute(
+                    "INSERT INTO texts VALUES (?, ?);",
+                    (key, _read(files, f"{sample}_02_processed_text.txt")),
+                )
+                self.conn.executemany(
+                    "INSERT INTO hpo_terms VALUES (?, ?, ?, ?);",
+                    [(key, "raw", h, m) for h, m in raw] + [(key, "filtered", h, m) for h, m in filtered],
+                )
+                self.conn.executemany(
+                    "INSERT INTO gene_ranks VALUES (?, ?, ?);",
+                    [(key, i, g) for i, g in enumerate(genes, 1)],
+                )
+                self.conn.executemany(
+                    "INSERT INTO files VALUES (?, ?, ?);",
+                    [(key, n, c) for n, c in files.items()],
+                )
+        log.info(f"Stored results for {', '.join(doc_keys)} ({'done' if ok else 'failed'})")
+
+    def link(self, src_key: str, dst_keys: Iterable[str]):
+        dst_keys = [k for k in dst_keys if k != src_key]
+        if not dst_keys:
+            return
+        with self.conn:
+            self._delete(dst_keys)
+            for key in dst_keys:
+                for table in TABLES:
+                    cols = [r[1] for r in self.conn.execute(f"PRAGMA table_info({table});")]
+                    select = ", ".join("?" if c == "doc_key" else c for c in cols)
+                    self.conn.execute(
+                        f"INSERT INTO {table} SELECT {select} FROM {table} WHERE doc_key = ?;",
+                        (key, src_key),
+                    )
+
+    def export(self, out_root: Path, sample: Optional[str] = None) -> int:
+        query = "SELECT d.sample, f.doc_key, f.name, f.content FROM files f JOIN documents d USING (doc_key)"
+        rows = (
+            self.conn.execute(query + " WHERE d.sample = ?;", (sample,))
+            if sample
+            else self.conn.execute(query + ";")
+        )
+        docs = set()
+        for smp, key, name, content in rows:
+            dst = out_root / f"result_{smp}" / key
+            dst.mkdir(parents=True, exist_ok=True)
+            (dst / name).write_bytes(content)
+            docs.add(key)
+        return len(docs)
+
+    def _delete(self, doc_keys: List[str]):
+        for table in TABLES:
+            self.conn.executemany(f"DELETE FROM {table} WHERE doc_key = ?;", [(k,) for k in doc_keys])
@@ -1,6 +1,8 @@
 # modules/text_ops.py
 import re
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, Optional, List, Tuple
 import nltk
 import transformers
 from .utils import log, DeepSeekClient
@@ -13,38 +15,155 @@ tokenizer = transformers.AutoTokenizer.from_pretrained(
     trust_remote_code=True,
 )
 
+@lru_cache(maxsize=None)
+def ensure_punkt():
+    nltk.download("punkt", quiet=True)
+
 def split_text(text: str):
     sentences = nltk.sent_tokenize(text)
     mid = len(sentences) // 2
     return " ".join(sentences[:mid]), " ".join(sentences[mid:])
 
+class SentenceStream:
+    """Cuts streamed LLM deltas into complete sentences and hands them to a sink."""
+
+    def __init__(self, sink: Callable[[str], None], reset_sink: Optional[Callable[[], None]] = None):
+        self.sink = sink
+        self.reset_sink = reset_sink
+        self.buf = ""
+
+    def feed(self, delta: str):
+        self.buf += delta
+        sentences = nltk.sent_tokenize(self.buf)
+        if len(sentences) < 2:
+            return
+        for s in sentences[:-1]:
+            self.sink(s)
+        self.buf = self.buf[self.buf.rfind(sentences[-1]):]
+
+    def flush(self):
+        tail = self.buf.strip()
+        self.buf = ""
+        if tail:
+            self.sink(tail)
+
+    def reset(self):
+        self.buf = ""
+        if self.reset_sink:
+            self.reset_sink()
+
 def write_text(text: str, suffix: str, sample_name: str, result_dir: Path):
     path = result_dir / f"{sample_name}{suffix}.txt"
     path.write_text(text + "\n", encoding="utf-8")
     log.debug(f"Text successfully written: {path}")
 
-def process_text(text: str, chat: DeepSeekClient, sample_name: str, result_dir: Path) -> str:
+TRANSLATE_PROMPT = (
+    "You are a senior clinical translator. Receive Russian medical text and convert it into a fluent English "
+    "clinical narrative suitable for automated phenotypic annotation by PhenoTagger (PubTator).\n\n"
+    "Output REQUIREMENTS:\n"
+    "- Return a continuous paragraph (or several full sentences) of plain text, no bullet points, no numbering.\n"
+    "- Do NOT append HPO codes, summaries or any extra commentary.\n\n"
+    "Steps you must follow:\n"
+    "1. Translate the entire text to English, preserving accurate medical terminology.\n"
+    "2. Expand every Russian or Latin abbreviation to its full form.\n"
+    "3. Correct all spelling and grammar errors.\n"
+    "4. Remove personal identifiers (names, addresses, record numbers, hospital names) and specific calendar dates; keep relative durations (e.g. “for three months”).\n"
+    "5. KEEP every clinically relevant statement about the patient: symptoms, signs, diagnoses, procedures, anatomical descriptions, and observable findings.\n"
+    "6. Remove laboratory numeric values, medication lists, treatment recommendations and administrative details.\n"
+    "7. Preserve explicit negations (e.g. \"no fever\", \"no seizures\") in the same sentence—they improve downstream NER.\n\n"
+    "Return ONLY the cleaned English clinical narrative text."
+)
+
+CLEANUP_PROMPT = (
+    "Rewrite this English clinical note as a plain-text narrative for PhenoTagger (PubTator).\n"
+    "- Expand abbreviations and fix spelling.\n"
+    "- Remove personal identifiers and calendar dates; keep relative durations.\n"
+    "- Remove lab values, medications, recommendations and administrative details.\n"
+    "- Keep every clinical finding and every explicit negation.\n"
+    "Return ONLY the narrative, no lists or commentary."
+)
+
+MIXED_PROMPT = (
+    "Rewrite this mostly English clinical note as a plain-text English narrative for PhenoTagger (PubTator).\n"
+    "- Translate any passages in another language into English clinical language.\n"
+    "- Expand abbreviations and fix spelling.\n"
+    "- Remove personal identifiers and calendar dates; keep relative durations.\n"
+    "- Remove lab values, medications, recommendations and administrative details.\n"
+    "- Keep every clinical finding and every explicit negation.\n"
+    "Return ONLY the narrative, no lists or commentary."
+)
+
+CLEANUP_MODEL = "gpt-4.1-mini"
+
+CYRILLIC_RE = re.compile(r"[\u0400-\u04FF]")
+LATIN_RE = re.compile(r"[A-Za-z]")
+ACCENTED_RE = re.compile(r"[\u00C0-\u024F]")
+# Share of the note that may be non-English before the full translation prompt is used.
+MIXED_MAX_FOREIGN = 0.5
+
+
+def _is_english(segment: str) -> bool:
+    # Decided by script: plain ASCII Latin is English, whatever its wording
+    # (terse clinical lists have hardly any function words); Cyrillic or a
+    # run of accented Latin letters marks another language.
+    cyr = len(CYRILLIC_RE.findall(segment))
+    acc = len(ACCENTED_RE.findall(segment))
+    lat = len(LATIN_RE.findall(segment)) + acc
+    return cyr <= 0.1 * (cyr + lat) and acc <= 0.02 * (cyr + lat)
+
+
+def language_runs(text: str) -> List[Tuple[bool, str]]:
+    """Split a note into consecutive runs of English / non-English sentences."""
+    runs: List[Tuple[bool, str]] = []
+    for line in text.splitlines():
+        for sent in nltk.sent_tokenize(line) or [line]:
+            if not sent.strip():
+                continue
+            eng = _is_english(sent)
+            if runs and runs[-1][0] == eng:
+                runs[-1] = (eng, f"{runs[-1][1]} {sent}")
+            else:
+                runs.append((eng, sent))
+        if runs:
+            runs[-1] = (runs[-1][0], runs[-1][1] + "\n")
+    return [(eng, t.strip()) for eng, t in runs]
+
+
+def process_text(
+    text: str,
+    chat: DeepSeekClient,
+    sample_name: str,
+    result_dir: Path,
+    stream: Optional[SentenceStream] = None,
+) -> str:
     tokens = tokenizer.encode(text)
     if len(tokens) > 8192:
         p1, p2 = split_text(text)
-        return process_text(p1, chat, sample_name, result_dir) + "\n" + process_text(p2, chat, sample_name, result_dir)
-    prompt = (
-        "You are a senior clinical translator. Receive Russian medical text and convert it into a fluent English "
-        "clinical narrative suitable for automated phenotypic annotation by PhenoTagger (PubTator).\n\n"
-        "Output REQUIREMENTS:\n"
-        "- Return a continuous paragraph (or several full sentences) of plain text, no bullet points, no numbering.\n"
-        "- Do NOT append HPO codes, summaries or any extra commentary.\n\n"
-        "Steps you must follow:\n"
-        "1. Translate the entire text to English, preserving accurate medical terminology.\n"
-        "2. Expand every Russian or Latin abbreviation to its full form.\n"
-        "3. Correct all spelling and grammar errors.\n"
-        "4. Remove personal identifiers (names, addresses, record numbers, hospital names) and specific calendar dates; keep relative durations (e.g. “for three months”).\n"
-        "5. KEEP every clinically relevant statement about the patient: symptoms, signs, diagnoses, procedures, anatomical descriptions, and observable findings.\n"
-        "6. Remove laboratory numeric values, medication lists, treatment recommendations and administrative details.\n"
-        "7. Preserve explicit negations (e.g. \"no fever\", \"no seizures\") in the same sentence—they improve downstream NER.\n\n"
-        "Return ONLY the cleaned English clinical narrative text."
+        return (
+            process_text(p1, chat, sample_name, result_dir, stream)
+            + "\n"
+            + process_text(p2, chat, sample_name, result_dir, stream)
+        )
+    runs = language_runs(text)
+    total = sum(len(t) for _, t in runs)
+    foreign = sum(len(t) for eng, t in runs if not eng)
+    prompt, model = TRANSLATE_PROMPT, "gpt-4.1"
+    if runs and not foreign:
+        log.info("Language: English; cleanup-only path")
+        prompt, model = CLEANUP_PROMPT, CLEANUP_MODEL
+    elif runs and foreign <= MIXED_MAX_FOREIGN * total:
+        log.info(f"Language: mixed ({foreign / total:.0%} non-English); single cleanup-and-translate call")
+        prompt, model = MIXED_PROMPT, CLEANUP_MODEL
+    processed = chat.ask(
+        text,
+        prompt,
+        model=model,
+        temperature=0.1,
+        delta_cb=stream.feed if stream else None,
+        reset_cb=stream.reset if stream else None,
     )
-    processed = chat.ask(text, prompt, temperature=0.1)
+    if stream:
+        stream.flush()
     write_text(prompt, "_02_prompt", sample_name, result_dir)
     write_text(processed, "_02_processed_text", sample_name, result_dir)
     return processed
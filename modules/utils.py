@@ -2,7 +2,10 @@ from pathlib import Path
 import sys
 import json
 import logging
+import random
+import threading
 import time
+from multiprocessing.managers import BaseManager, DictProxy
 from typing import Optional, Callable
 
 from dotenv import load_dotenv
@@ -32,6 +35,141 @@ def setup_logging_file_only(log_file: Path, log_level: str = "info"):
 
 log = logging.getLogger(__name__)
 
+class RateLimiter:
+    """Process-wide LLM budget: RPM/TPM token buckets plus AIMD concurrency.
+
+    Concurrency grows by one after a full window of fast successes and is
+    halved on a 429; a Retry-After from the server pauses all callers. Only
+    requests admitted after the last decrease can trigger another one, so a
+    burst of in-flight 429s counts as a single congestion event. Latency is
+    time to first token, which does not grow with the answer length.
+    """
+
+    def __init__(
+        self,
+        rpm: int = 500,
+        tpm: int = 300_000,
+        max_concurrency: int = 8,
+        latency_target: float = 20.0,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = max(1, self.max_concurrency // 2)
+        self.latency_target = latency_target
+        self._cond = threading.Condition()
+        self._active = 0
+        self._successes = 0
+        self._epoch = 0
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._stamp = time.monotonic()
+        self._resume_at = 0.0
+        self._log_limits("initial")
+
+    def _log_limits(self, reason: str):
+        log.info(
+            f"LLM limits ({reason}): concurrency={self.concurrency}/{self.max_concurrency} "
+            f"rpm={self.rpm} tpm={self.tpm}"
+        )
+
+    def _refill(self, now: float):
+        elapsed = now - self._stamp
+        self._stamp = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int) -> int:
+        tokens = min(tokens, self.tpm)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                waits = [self._resume_at - now]
+                if self._requests < 1:
+                    waits.append((1 - self._requests) * 60 / self.rpm)
+                if self._tokens < tokens:
+                    waits.append((tokens - self._tokens) * 60 / self.tpm)
+                wait = max(waits)
+                if wait <= 0 and self._active < self.concurrency:
+                    self._active += 1
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return self._epoch
+                self._cond.wait(timeout=max(wait, 0.05) if wait > 0 else None)
+
+    def release(self, ticket: int, outcome: str, latency: float, refund: int = 0):
+        with self._cond:
+            self._active -= 1
+            self._tokens = min(self.tpm, self._tokens + refund)
+            congested = outcome == "throttled" or (outcome == "ok" and latency > self.latency_target)
+            if congested:
+                self._successes = 0
+                if ticket == self._epoch and self.concurrency > 1:
+                    self._epoch += 1
+                    if outcome == "throttled":
+                        self.concurrency = max(1, self.concurrency // 2)
+                        self._log_limits("429 received")
+                    else:
+                        self.concurrency -= 1
+                        self._log_limits(f"slow first token {latency:.0f}s")
+            elif outcome == "ok":
+                self._successes += 1
+                if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self._successes = 0
+                    self.concurrency += 1
+                    self._log_limits("additive increase")
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+class LimiterManager(BaseManager):
+    """Serves one RateLimiter (and the task -> worker pid map) to every process of a process-pool batch."""
+
+LimiterManager.register("RateLimiter", RateLimiter)
+LimiterManager.register("dict", dict, DictProxy)
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def configure_rate_limiter(**kwargs) -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        _limiter = RateLimiter(**kwargs)
+        return _limiter
+
+def set_rate_limiter(limiter):
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+def count_tokens(text: str) -> int:
+    from .text_ops import tokenizer
+
+    return len(tokenizer.encode(text))
+
+def _retry_after(err: Exception) -> float:
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return 0.0
+
 class DeepSeekClient:
     def __init__(
         self,
@@ -39,7 +177,17 @@ class DeepSeekClient:
         timeout: float = 90.0,
         max_retries: int = 5,
         backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        client: Optional[OpenAI] = None,
     ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tail_cb: Optional[Callable[[str], None]] = None
+        if client is not None:
+            # Shared by long-lived callers so the HTTP connection pool stays warm.
+            self.client = client
+            return
         load_dotenv()
         if not api_key:
             if Path(".env").exists():
@@ -50,9 +198,6 @@ class DeepSeekClient:
             log.error("OPENAI_API_KEY not provided")
             sys.exit(1)
         self.client = OpenAI(api_key=api_key, timeout=timeout)
-        self.max_retries = max_retries
-        self.backoff = backoff
-        self.tail_cb: Optional[Callable[[str], None]] = None
 
     def ask(
         self,
@@ -60,8 +205,20 @@ class DeepSeekClient:
         prompt: str,
         model: str = "gpt-4.1",
         temperature: float = 0.3,
+        delta_cb: Optional[Callable[[str], None]] = None,
+        reset_cb: Optional[Callable[[], None]] = None,
     ) -> str:
+        limiter = get_rate_limiter()
+        max_tokens = 8192
+        prompt_tokens = count_tokens(prompt) + count_tokens(text)
+        reserved = prompt_tokens + min(max_tokens, prompt_tokens)
         for attempt in range(1, self.max_retries + 1):
+            if attempt > 1 and reset_cb:
+                reset_cb()
+            ticket = limiter.acquire(reserved)
+            start = time.monotonic()
+            first_token = None
+            outcome, refund = "error", 0
             try:
                 resp = self.client.chat.completions.create(
                     model=model,
@@ -71,14 +228,18 @@ class DeepSeekClient:
                     ],
                     temperature=temperature,
                     stream=True,
-                    max_tokens=8192,
+                    max_tokens=max_tokens,
                 )
                 buf = []
                 for chunk in resp:
                     delta = chunk.choices[0].delta.content
                     if not delta:
                         continue
+                    if first_token is None:
+                        first_token = time.monotonic()
                     buf.append(delta)
+                    if delta_cb:
+                        delta_cb(delta)
                     tail_raw = ("".join(buf))[-100:]
                     tail = tail_raw.replace("\n", " ").replace("\r", " ")
                     if self.tail_cb:
@@ -89,12 +250,26 @@ class DeepSeekClient:
                 if not self.tail_cb:
                     sys.stdout.write("\x1b[2K\r")
                     sys.stdout.flush()
-                return "".join(buf).strip()
+                answer = "".join(buf).strip()
+                outcome = "ok"
+                refund = reserved - prompt_tokens - count_tokens(answer)
+                return answer
             except (APIConnectionError, APITimeoutError, RateLimitError) as err:
                 log.warning(f"API error: {err.__class__.__name__} – attempt {attempt}/{self.max_retries}")
+                retry_after = 0.0
+                if isinstance(err, RateLimitError):
+                    outcome = "throttled"
+                    retry_after = _retry_after(err)
+                    if retry_after:
+                        limiter.pause(retry_after)
                 if attempt == self.max_retries:
                     raise
-                time.sleep(self.backoff * attempt)
+                base = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                delay = max(retry_after, base / 2 + random.uniform(0, base / 2))
+            finally:
+                latency = (first_token or time.monotonic()) - start
+                limiter.release(ticket, outcome, latency, refund)
+            time.sleep(delay)
 
 def check_file_exists(file_path: Path):
     if not file_path.exists():
@@ -0,0 +1,93 @@
+# phenotagger_server.py
+# Runs inside the PhenoTagger container and keeps its model loaded between runs.
+# Reads one JSON request per stdin line ({"in": dir, "out": dir}), runs
+# PhenoTagger_tagging.py on it in this process and answers one JSON line.
+import importlib
+import json
+import os
+import runpy
+import sys
+import tempfile
+import traceback
+
+SRC = "/PhenoTagger/src"
+SCRIPT = os.path.join(SRC, "PhenoTagger_tagging.py")
+
+
+def _once(fn):
+    done = set()
+
+    def wrapper(*args, **kwargs):
+        key = repr((args, sorted(kwargs.items())))
+        if key not in done:
+            fn(*args, **kwargs)
+            done.add(key)
+
+    return wrapper
+
+
+def _cached(cls):
+    instances = {}
+
+    def make(*args, **kwargs):
+        key = repr((args, sorted(kwargs.items())))
+        if key not in instances:
+            inst = cls(*args, **kwargs)
+            if callable(getattr(inst, "load_model", None)):
+                inst.load_model = _once(inst.load_model)
+            instances[key] = inst
+        return instances[key]
+
+    return make
+
+
+def _cache_constructors(module_name):
+    # The tagging script builds its dictionary and model on every run; the
+    # script is re-run per request, but these classes hand back the instances
+    # (and loaded weights) of the first run.
+    try:
+        mod = importlib.import_module(module_name)
+    except Exception:
+        return
+    for name, obj in list(vars(mod).items()):
+        if isinstance(obj, type) and obj.__module__ == mod.__name__:
+            setattr(mod, name, _cached(obj))
+
+
+def _tag(in_dir, out_dir):
+    sys.argv = [SCRIPT, "-i", in_dir.rstrip("/") + "/", "-o", out_dir.rstrip("/") + "/"]
+    try:
+        runpy.run_path(SCRIPT, run_name="__main__")
+    except SystemExit as e:
+        if e.code:
+            return {"ok": False, "error": f"exit code {e.code}"}
+    except Exception:
+        return {"ok": False, "error": traceback.format_exc(limit=5)}
+    return {"ok": True}
+
+
+def main():
+    os.chdir(SRC)
+    sys.path.insert(0, SRC)
+    for module_name in ("nn_model", "dic_ner"):
+        _cache_constructors(module_name)
+    out = sys.stdout
+    sys.stdout = sys.stderr  # PhenoTagger prints progress
+
+    # Load the model before reporting ready, so the first chunk does not pay it.
+    warm_in, warm_out = tempfile.mkdtemp(), tempfile.mkdtemp()
+    with open(os.path.join(warm_in, "warmup.PubTator"), "w", encoding="utf-8") as f:
+        f.write("1|t|description\n1|a|The patient has seizures.\n\n\n")
+    out.write(json.dumps(_tag(warm_in, warm_out)) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        out.write(json.dumps(_tag(req["in"], req["out"])) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()